@@ -1,7 +1,28 @@
+import csv
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import mimetypes
 import os
+import queue
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify, send_from_directory, abort
+from urllib.parse import quote
+import click
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, abort
 from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup, escape
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from sqlalchemy.sql import func
@@ -23,7 +44,27 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
 }
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Upload storage: 'local' (uploads/ folder) ya 's3' (S3/MinIO - multi-instance deployments ke liye)
+app.config['STORAGE_BACKEND'] = os.environ.get("STORAGE_BACKEND", "local")
+app.config['S3_BUCKET'] = os.environ.get("S3_BUCKET")
+app.config['S3_PREFIX'] = os.environ.get("S3_PREFIX", "")
+app.config['S3_ENDPOINT_URL'] = os.environ.get("S3_ENDPOINT_URL")  # MinIO waghera ke liye
+app.config['S3_REGION'] = os.environ.get("S3_REGION")
+app.config['S3_PUBLIC_URL'] = os.environ.get("S3_PUBLIC_URL")  # CDN/public bucket ho to presign ki zaroorat nahi
+app.config['S3_PRESIGN_EXPIRY'] = int(os.environ.get("S3_PRESIGN_EXPIRY", "3600"))
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+# Upload ke baad PDF optimization - images recompress karna ghostscript se hota hai (optional)
+app.config['PDF_RECOMPRESS_IMAGES'] = os.environ.get("PDF_RECOMPRESS_IMAGES", "0") == "1"
+app.config['PDF_OPTIMIZE_TIMEOUT'] = int(os.environ.get("PDF_OPTIMIZE_TIMEOUT", "600"))
+# PDF cards ke liye pehle safhe ki cover image (pixels me chaudai)
+app.config['COVER_WIDTH'] = int(os.environ.get("COVER_WIDTH", "320"))
+COVER_EXTENSIONS = ['webp', 'jpg']
+# Versioned cover ka naam: <pdf>.cover.<chaudai>-<hash>.<ext> - sirf yehi immutable serve hote hain
+VERSIONED_COVER_RE = re.compile(r'\.cover\.\d+-[0-9a-f]{10}\.(webp|jpg)$')
+# Fingerprinted static assets - `flask build-assets` static/build me likhta hai
+ASSET_BUILD_DIR = 'build'
+ASSET_MANIFEST = 'assets-manifest.json'
+COMPRESSIBLE_EXTENSIONS = ['.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.webmanifest', '.ico']
 
 # Upload folders create karen
 os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'pdfs'), exist_ok=True)
@@ -48,6 +89,10 @@ class PdfCategory(db.Model):
     image = db.Column(db.String(200))
     view_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Offline bundle - sirf in fields ke badalne par updated_at aur bundle badalta hai
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    bundle_etag = db.Column(db.String(64))
+    bundle_fields = ('name', 'description', 'image')
     pdfs = db.relationship('Pdf', backref='category', lazy=True, cascade='all, delete-orphan')
 
 class Pdf(db.Model):
@@ -58,6 +103,20 @@ class Pdf(db.Model):
     view_count = db.Column(db.Integer, default=0)
     download_count = db.Column(db.Integer, default=0)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Optimization: pending / optimized / skipped / failed
+    optimize_status = db.Column(db.String(50), default='pending')
+    original_size = db.Column(db.Integer)
+    optimized_size = db.Column(db.Integer)
+    has_cover = db.Column(db.Boolean, default=False)
+    # Cover ki chaudai aur content hash - naya cover naye URL par aata hai
+    cover_version = db.Column(db.String(40))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    bundle_fields = ('title', 'filename', 'category_id', 'optimized_size')
+
+    def cover_filename(self, ext='webp'):
+        if self.cover_version:
+            return f"{self.filename}.cover.{self.cover_version}.{ext}"
+        return f"{self.filename}.cover.{ext}"
 
 class ReferenceTopic(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -66,15 +125,29 @@ class ReferenceTopic(db.Model):
     image = db.Column(db.String(200))
     view_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    bundle_etag = db.Column(db.String(64))
+    bundle_fields = ('name', 'description', 'image')
     references = db.relationship('Reference', backref='topic', lazy=True, cascade='all, delete-orphan')
 
 class Reference(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     topic_id = db.Column(db.Integer, db.ForeignKey('reference_topic.id'), nullable=False)
     title = db.Column(db.String(300), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # Content sirf detail/edit page par load hota hai - lists excerpt istemal karti hain
+    content = db.deferred(db.Column(db.Text, nullable=False))
+    excerpt = db.Column(db.String(300))
+    content_length = db.Column(db.Integer, default=0)
     view_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    bundle_fields = ('title', 'content', 'topic_id')
+
+    @db.validates('content')
+    def sync_excerpt(self, key, content):
+        self.excerpt = make_excerpt(content)
+        self.content_length = len(content or '')
+        return content
 
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -85,6 +158,12 @@ class Question(db.Model):
     reply_reference = db.Column(db.Text)
     replied_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Sawal poochne wale ka opaque token - naam se kisi aur ke sawal nahi dekhe ja sakte
+    asker_token = db.Column(db.String(64))
+
+    __table_args__ = (
+        db.Index('ix_question_asker_token_created_at', 'asker_token', 'created_at'),
+    )
 
 class Bookmark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -103,6 +182,764 @@ def get_or_create_user_id():
         session['user_id'] = os.urandom(16).hex()
     return session['user_id']
 
+ASKER_TOKEN_PATTERN = re.compile(r'[0-9a-f]{48}')
+MY_QUESTIONS_PAGE_SIZE = 20
+
+def get_asker_token():
+    """Sawal parhne ke liye token - localStorage se POST field ya X-Asker-Token header, warna session ka.
+
+    Client ka bheja hua token sirf parhne me istemal hota hai, session me kabhi save nahi hota -
+    warna koi link bhej kar apna token kisi aur ke session me bitha sakta hai.
+    """
+    supplied = request.form.get('token') or request.headers.get('X-Asker-Token', '')
+    if ASKER_TOKEN_PATTERN.fullmatch(supplied):
+        return supplied
+    return session.get('asker_token')
+
+def get_or_create_asker_token():
+    """Naye sawal ke liye sirf isi session ka jari kiya hua token - bahar se aya token kabhi nahi"""
+    if 'asker_token' not in session:
+        session['asker_token'] = os.urandom(24).hex()
+    return session['asker_token']
+
+# ===================== UPLOAD STORAGE =====================
+
+def _guess_content_type(key):
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+class LocalStorage:
+    """Uploads local filesystem par - key 'pdfs/<filename>' jaisi hoti hai"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def save(self, file, key):
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        file.save(self.path(key))
+
+    def put_file(self, local_path, key, cache_control=None):
+        if os.path.abspath(local_path) != os.path.abspath(self.path(key)):
+            os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+            shutil.copyfile(local_path, self.path(key))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        if os.path.exists(self.path(key)):
+            os.remove(self.path(key))
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    @contextmanager
+    def local_copy(self, key):
+        """File ka local path - local storage me asal file hi"""
+        yield self.path(key)
+
+    def send(self, key, as_attachment=False, download_name=None, max_age=None, immutable=False):
+        folder, filename = key.rsplit('/', 1)
+        response = send_from_directory(self.path(folder), filename, as_attachment=as_attachment,
+                                       download_name=download_name, max_age=max_age)
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+class S3Storage:
+    """S3-compatible storage (AWS S3, MinIO) - downloads presigned redirect se, Python worker se nahi guzarte"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, public_url=None, presign_expiry=3600):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.presign_expiry = presign_expiry
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        # 8MB se bari files multipart me stream hoti hain - poori file memory me nahi aati
+        self.transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024,
+                                              multipart_chunksize=8 * 1024 * 1024)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def save(self, file, key):
+        self.client.upload_fileobj(file.stream, self.bucket, self._key(key),
+                                   ExtraArgs={'ContentType': _guess_content_type(key)},
+                                   Config=self.transfer_config)
+
+    def put_file(self, local_path, key, cache_control=None):
+        extra_args = {'ContentType': _guess_content_type(key)}
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        self.client.upload_file(local_path, self.bucket, self._key(key),
+                                ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        # S3 ek request me zyada se zyada 1000 objects hazf karta hai
+        for start in range(0, len(keys), 1000):
+            objects = [{'Key': self._key(key)} for key in keys[start:start + 1000]]
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+
+    @contextmanager
+    def local_copy(self, key):
+        """File ko temp folder me download karen - bahar nikalte hi hazf"""
+        with tempfile.TemporaryDirectory(prefix='dalildocs-') as tmp_dir:
+            local_path = os.path.join(tmp_dir, os.path.basename(key))
+            self.client.download_file(self.bucket, self._key(key), local_path, Config=self.transfer_config)
+            yield local_path
+
+    def send(self, key, as_attachment=False, download_name=None, max_age=None, immutable=False):
+        if self.public_url and not as_attachment:
+            response = redirect(f"{self.public_url}/{quote(self._key(key))}")
+            if max_age:
+                response.cache_control.public = True
+                response.cache_control.max_age = max_age
+            return response
+
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if as_attachment:
+            filename = download_name or os.path.basename(key)
+            params['ResponseContentDisposition'] = f"attachment; filename*=UTF-8''{quote(filename, safe='')}"
+        if immutable:
+            params['ResponseCacheControl'] = f'public, max-age={max_age}, immutable'
+        url = self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expiry)
+        response = redirect(url)
+        if max_age:
+            # Har dafa naya signature banta hai - redirect cache ho to browser wahi URL aur cached file istemal kare.
+            # Signature ke expire hone se pehle redirect ka cache khatam ho jana chahiye.
+            response.cache_control.private = True
+            response.cache_control.max_age = max(0, min(max_age, self.presign_expiry - 300))
+        return response
+
+def create_storage():
+    if app.config['STORAGE_BACKEND'] == 's3':
+        return S3Storage(app.config['S3_BUCKET'],
+                         prefix=app.config['S3_PREFIX'],
+                         endpoint_url=app.config['S3_ENDPOINT_URL'],
+                         region=app.config['S3_REGION'],
+                         public_url=app.config['S3_PUBLIC_URL'],
+                         presign_expiry=app.config['S3_PRESIGN_EXPIRY'])
+    return LocalStorage(app.config['UPLOAD_FOLDER'])
+
+storage = create_storage()
+
+def save_upload(file, folder):
+    """Upload ko unique naam se storage me rakhen aur naya filename wapas den"""
+    filename = secure_filename(file.filename)
+    unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
+    storage.save(file, f'{folder}/{unique_filename}')
+    return unique_filename
+
+EXCERPT_LENGTH = 200
+SNIPPET_RADIUS = 80
+SNIPPET_LENGTH = 240
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """Hawale ka chhota hissa lists ke liye - lafz ke beech se nahi katta"""
+    text = ' '.join((text or '').split())
+    if len(text) <= length:
+        return text
+    cut = text.rfind(' ', 0, length)
+    return text[:cut if cut > 0 else length] + '…'
+
+def highlight_snippet(text, query):
+    """Snippet me search ke alfaz <mark> me - baqi text escape hota hai"""
+    parts = re.split(f'({re.escape(query)})', text or '', flags=re.IGNORECASE)
+    return Markup('').join(Markup('<mark>%s</mark>') % part if index % 2 else escape(part)
+                           for index, part in enumerate(parts))
+
+def text_position(column, query):
+    """Column me query ki jagah (1 se shuru, na mile to 0) - SQLite aur PostgreSQL dono par"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.strpos(func.lower(column), query.lower())
+    return func.instr(func.lower(column), query.lower())
+
+def cover_keys(filename, cover_version=None):
+    """Cover images ki storage keys - version na ho to purane (bina version) naam"""
+    suffix = f'.{cover_version}' if cover_version else ''
+    return [f'pdfs/{filename}.cover{suffix}.{ext}' for ext in COVER_EXTENSIONS]
+
+def delete_old_covers(filename, old_version, new_version):
+    """Naya cover lagne ke baad purana version aur bina version wale covers hazf karen"""
+    if old_version == new_version:
+        return
+    keys = cover_keys(filename)
+    if old_version:
+        keys.extend(cover_keys(filename, old_version))
+    storage.delete_many(keys)
+
+def delete_pdf_files(*pdfs):
+    """PDF files aur un ki cover images hazf karen - har item (filename, cover_version)"""
+    keys = []
+    for filename, cover_version in pdfs:
+        keys.append(f'pdfs/{filename}')
+        keys.extend(cover_keys(filename))
+        if cover_version:
+            keys.extend(cover_keys(filename, cover_version))
+    storage.delete_many(keys)
+
+# SQLite/PostgreSQL integer ki had - is se bari id par query OverflowError deti hai
+MAX_ROW_ID = 2 ** 63 - 1
+
+def parse_row_id(value):
+    """Form/CSV ki value ko id banayen - ghalat ya had se bahar ho to None"""
+    value = value.strip()
+    # isdigit '²' jaisi values bhi maan leta hai jin par int() nakam hota hai
+    if not value.isdecimal():
+        return None
+    row_id = int(value)
+    return row_id if 1 <= row_id <= MAX_ROW_ID else None
+
+def get_selected_ids():
+    """Multi-select form se chuni hui ids"""
+    ids = (parse_row_id(value) for value in request.form.getlist('ids'))
+    return [row_id for row_id in ids if row_id is not None]
+
+def read_titles_csv(file, max_length):
+    """CSV (id,title) parh kar ({id: title}, lambe unwanon ki ids) wapas den - header aur khali rows chhor den.
+
+    File UTF-8 na ho to UnicodeDecodeError.
+    """
+    titles = {}
+    too_long = []
+    for row in csv.reader(io.TextIOWrapper(file.stream, encoding='utf-8-sig')):
+        row_id = parse_row_id(row[0]) if len(row) >= 2 else None
+        if row_id is not None and row[1].strip():
+            if len(row[1].strip()) > max_length:
+                too_long.append(row_id)
+            else:
+                titles[row_id] = row[1].strip()
+    return titles, too_long
+
+# ===================== STATIC ASSETS =====================
+
+_asset_manifest = None
+
+def get_asset_manifest():
+    global _asset_manifest
+    if _asset_manifest is None:
+        manifest_path = os.path.join(app.static_folder, ASSET_BUILD_DIR, ASSET_MANIFEST)
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                _asset_manifest = json.load(f)
+        except (OSError, ValueError):
+            _asset_manifest = {'assets': {}, 'version': None}
+    return _asset_manifest
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    """url_for('static', filename=...) khud hi hashed file ka URL bana deta hai"""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = get_asset_manifest()['assets'].get(values['filename'], values['filename'])
+
+def send_static_asset(filename, max_age, immutable=False):
+    """Static file bhejen - browser support kare to pehle se bani .br/.gz file"""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.exists(os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype, max_age=max_age)
+            response.content_encoding = encoding
+            break
+    if response is None:
+        response = send_from_directory(app.static_folder, filename, mimetype=mimetype, max_age=max_age)
+
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    elif not max_age:
+        response.cache_control.no_cache = True
+    return response
+
+def serve_static(filename):
+    if filename.startswith(ASSET_BUILD_DIR + '/'):
+        # Hashed naam - content badle to URL bhi badal jata hai
+        return send_static_asset(filename, max_age=365 * 24 * 3600, immutable=True)
+    return app.send_static_file(filename)
+
+app.view_functions['static'] = serve_static
+
+def build_static_assets():
+    """static/ ki har file ki hashed copy, gzip/brotli variants aur manifest banayen"""
+    global _asset_manifest
+    # Brotli lazmi hai - iske baghair build ko chup chaap .br ke baghair nahi chalna chahiye
+    import brotli
+
+    static_dir = app.static_folder
+    build_dir = os.path.join(static_dir, ASSET_BUILD_DIR)
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+
+    def write_variants(path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+        if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0)),
+                    ('.br', brotli.compress(data, quality=11))]
+        for suffix, compressed in variants:
+            if len(compressed) < len(data):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+
+    assets = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.samefile(root, static_dir):
+            dirs[:] = [d for d in dirs if d != ASSET_BUILD_DIR]
+        for name in sorted(files):
+            source_path = os.path.join(root, name)
+            logical_name = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            # Service worker ka URL hamesha /sw.js hi rehna chahiye
+            if logical_name == 'service-worker.js':
+                continue
+            with open(source_path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, ext = os.path.splitext(logical_name)
+            hashed_name = f"{ASSET_BUILD_DIR}/{stem}.{digest}{ext}"
+            os.makedirs(os.path.dirname(os.path.join(static_dir, hashed_name)), exist_ok=True)
+            write_variants(os.path.join(static_dir, hashed_name), data)
+            assets[logical_name] = hashed_name
+
+    version = hashlib.sha256(json.dumps(assets, sort_keys=True).encode()).hexdigest()[:12]
+    manifest = {'version': version, 'assets': assets}
+    with open(os.path.join(build_dir, ASSET_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    # Service worker ki precache list isi manifest se - deploy hone wali files se hamesha match
+    sw_source = os.path.join(static_dir, 'service-worker.js')
+    if os.path.exists(sw_source):
+        precache_urls = [f"{app.static_url_path}/{hashed}" for hashed in sorted(assets.values())]
+        prelude = (
+            "// Yeh file `flask build-assets` se bani hai - static/service-worker.js edit karen\n"
+            f"self.__PRECACHE_VERSION = {json.dumps(version)};\n"
+            f"self.__PRECACHE_URLS = {json.dumps(precache_urls, indent=2)};\n\n"
+        )
+        with open(sw_source, 'rb') as f:
+            write_variants(os.path.join(build_dir, 'service-worker.js'), prelude.encode('utf-8') + f.read())
+
+    _asset_manifest = manifest
+    return manifest
+
+# ===================== BACKGROUND JOBS =====================
+
+# Har queue ka apna worker thread - lambe kaam (bundles) upload processing ko nahi rokte
+_job_queues = {}
+_job_workers = {}
+_job_worker_lock = threading.Lock()
+_queued_job_keys = set()
+
+def enqueue_job(func, *args, queue_name='uploads'):
+    """Kaam ko background worker ki queue me daal den - request foran wapas ho jati hai"""
+    with _job_worker_lock:
+        job_queue = _job_queues.setdefault(queue_name, queue.Queue())
+        worker = _job_workers.get(queue_name)
+        if worker is None or not worker.is_alive():
+            worker = threading.Thread(target=_run_jobs, args=(job_queue,), name=f'dalildocs-{queue_name}', daemon=True)
+            worker.start()
+            _job_workers[queue_name] = worker
+    job_queue.put((func, args))
+
+def enqueue_unique_job(job_key, func, *args, queue_name='uploads'):
+    """Wahi kaam pehle se queue me ho to dobara na daalen"""
+    with _job_worker_lock:
+        if job_key in _queued_job_keys:
+            return
+        _queued_job_keys.add(job_key)
+    enqueue_job(_run_unique_job, job_key, func, *args, queue_name=queue_name)
+
+def _run_unique_job(job_key, func, *args):
+    # Key kaam shuru hone se pehle hatayen - chalte kaam ke dauran aayi tabdeeli ka naya kaam queue ho sake
+    with _job_worker_lock:
+        _queued_job_keys.discard(job_key)
+    func(*args)
+
+def _run_jobs(job_queue):
+    while True:
+        func, args = job_queue.get()
+        with app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                app.logger.exception("Background job %s fail ho gaya", func.__name__)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        job_queue.task_done()
+
+# ===================== PDF OPTIMIZATION =====================
+
+def _recompress_pdf_images(src_path, dst_path):
+    """Ghostscript se images ko /ebook quality par dobara compress karen"""
+    gs = shutil.which('gs')
+    if not gs:
+        return False
+    subprocess.run(
+        [gs, '-sDEVICE=pdfwrite', '-dPDFSETTINGS=/ebook', '-dCompatibilityLevel=1.5',
+         '-dNOPAUSE', '-dBATCH', '-dQUIET', f'-sOutputFile={dst_path}', src_path],
+        check=True, timeout=app.config['PDF_OPTIMIZE_TIMEOUT'])
+    return os.path.exists(dst_path)
+
+# pikepdf alag process me chalta hai taake kharab PDF par timeout lag sake
+_PIKEPDF_LINEARIZE = """
+import sys, pikepdf
+with pikepdf.open(sys.argv[1]) as pdf:
+    pdf.remove_unreferenced_resources()
+    pdf.save(sys.argv[2], linearize=True, compress_streams=True, recompress_flate=True,
+             object_stream_mode=pikepdf.ObjectStreamMode.generate)
+"""
+
+def _linearize_pdf(src_path, dst_path):
+    """Fast web view ke liye PDF linearize karen aur ghair-istemal objects hata den.
+
+    Har raasta PDF_OPTIMIZE_TIMEOUT ke andar khatam hota hai - warna worker thread atak jata hai.
+    """
+    timeout = app.config['PDF_OPTIMIZE_TIMEOUT']
+    if importlib.util.find_spec('pikepdf') is not None:
+        subprocess.run([sys.executable, '-c', _PIKEPDF_LINEARIZE, src_path, dst_path],
+                       check=True, timeout=timeout, capture_output=True)
+        return os.path.exists(dst_path)
+
+    qpdf = shutil.which('qpdf')
+    if not qpdf:
+        return False
+    result = subprocess.run(
+        [qpdf, '--linearize', '--object-streams=generate', '--compress-streams=y',
+         '--recompress-flate', '--remove-unreferenced-resources=yes', src_path, dst_path],
+        timeout=timeout)
+    # qpdf exit code 3 = warnings ke sath kamyab
+    return result.returncode in (0, 3) and os.path.exists(dst_path)
+
+def _pdf_still_exists(pdf_id, filename):
+    """Lambe kaam ke baad check - beech me PDF hazf ya tabdeel to nahi hui"""
+    exists = db.session.query(Pdf.id).filter_by(id=pdf_id, filename=filename).first() is not None
+    db.session.commit()
+    return exists
+
+def optimize_pdf(pdf_id):
+    """PDF ko optimize karen - nakami par original file hi rehti hai.
+
+    Lamba kaam kisi khuli transaction ke baghair hota hai; natija likhne se pehle row dobara parhi jati hai.
+    """
+    filename = db.session.query(Pdf.filename).filter_by(id=pdf_id).scalar()
+    db.session.commit()
+    if filename is None:
+        return
+
+    key = f'pdfs/{filename}'
+    status = 'failed'
+    original_size = optimized_size = None
+    if storage.exists(key):
+        with storage.local_copy(key) as file_path:
+            original_size = optimized_size = os.path.getsize(file_path)
+            recompressed_path = file_path + '.recompress.tmp'
+            optimized_path = file_path + '.optimize.tmp'
+            try:
+                source_path = file_path
+                if app.config['PDF_RECOMPRESS_IMAGES'] and _recompress_pdf_images(file_path, recompressed_path):
+                    # Sirf tab istemal karen jab file waqai choti hui ho
+                    if os.path.getsize(recompressed_path) < original_size:
+                        source_path = recompressed_path
+
+                if _linearize_pdf(source_path, optimized_path):
+                    # PDF beech me hazf ho gayi ho to file wapas likh kar orphan na banayen
+                    if not _pdf_still_exists(pdf_id, filename):
+                        return
+                    os.replace(optimized_path, file_path)
+                    storage.put_file(file_path, key)
+                    optimized_size = os.path.getsize(file_path)
+                    status = 'optimized'
+                else:
+                    status = 'skipped'
+            except Exception:
+                app.logger.exception("PDF %s optimize nahi ho saki - original file rakhi gayi", pdf_id)
+                status = 'failed'
+            finally:
+                for tmp_path in (recompressed_path, optimized_path):
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+    pdf = db.session.get(Pdf, pdf_id)
+    if pdf is None or pdf.filename != filename:
+        return
+    pdf.optimize_status = status
+    if original_size is not None:
+        pdf.original_size = original_size
+        pdf.optimized_size = optimized_size
+    db.session.commit()
+
+# ===================== PDF COVERS =====================
+
+def render_pdf_cover(pdf_path, width):
+    """Pehle safhe ki choti cover image (WebP + JPEG fallback) PDF ke sath hi likhen aur version wapas den.
+
+    Sirf file paths leta hai taake alag process me bhi chal sake.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        app.logger.warning("Pillow install nahi - %s ka cover nahi ban sakta", pdf_path)
+        return None
+
+    try:
+        import pymupdf
+    except ImportError:
+        pymupdf = None
+
+    if pymupdf is not None:
+        with pymupdf.open(pdf_path) as doc:
+            page = doc[0]
+            zoom = width / page.rect.width
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    else:
+        pdftoppm = shutil.which('pdftoppm')
+        if not pdftoppm:
+            app.logger.warning("pymupdf ya pdftoppm mojood nahi - %s ka cover nahi ban sakta", pdf_path)
+            return None
+        output_prefix = pdf_path + '.cover.tmp'
+        subprocess.run(
+            [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-png',
+             '-scale-to-x', str(width), '-scale-to-y', '-1', pdf_path, output_prefix],
+            check=True, timeout=120)
+        with Image.open(output_prefix + '.png') as rendered:
+            image = rendered.convert('RGB')
+        os.remove(output_prefix + '.png')
+
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)))
+
+    # Temp file me likh kar replace karen taake adhoori image serve na ho
+    tmp_webp = f"{pdf_path}.cover.webp.tmp"
+    tmp_jpg = f"{pdf_path}.cover.jpg.tmp"
+    image.save(tmp_webp, 'WEBP', quality=75, method=6)
+    image.save(tmp_jpg, 'JPEG', quality=80, optimize=True, progressive=True)
+    with open(tmp_webp, 'rb') as f:
+        version = f"{width}-{hashlib.sha256(f.read()).hexdigest()[:10]}"
+    os.replace(tmp_webp, f"{pdf_path}.cover.{version}.webp")
+    os.replace(tmp_jpg, f"{pdf_path}.cover.{version}.jpg")
+    return version
+
+def render_stored_cover(filename, width):
+    """Storage se PDF le kar cover banayen aur storage me wapas rakhen (alag process me bhi chalta hai)"""
+    key = f'pdfs/{filename}'
+    if not storage.exists(key):
+        return None
+    with storage.local_copy(key) as pdf_path:
+        version = render_pdf_cover(pdf_path, width)
+        if version is None:
+            return None
+        for ext in COVER_EXTENSIONS:
+            storage.put_file(f'{pdf_path}.cover.{version}.{ext}', f'{key}.cover.{version}.{ext}',
+                             cache_control='public, max-age=31536000, immutable')
+    return version
+
+def render_cover(pdf_id):
+    """Cover banayen - rendering transaction ke bahar, natija likhne se pehle row dobara parhi jati hai"""
+    row = db.session.query(Pdf.filename, Pdf.cover_version).filter_by(id=pdf_id).first()
+    db.session.commit()
+    if row is None:
+        return
+
+    version = render_stored_cover(row.filename, app.config['COVER_WIDTH'])
+    if version is None:
+        return
+
+    pdf = db.session.get(Pdf, pdf_id)
+    if pdf is None or pdf.filename != row.filename:
+        # PDF beech me hazf ho gayi - naya cover orphan na rahe
+        db.session.commit()
+        storage.delete_many(cover_keys(row.filename, version))
+        return
+    old_version = pdf.cover_version
+    pdf.cover_version = version
+    pdf.has_cover = True
+    db.session.commit()
+    delete_old_covers(row.filename, old_version, version)
+
+def save_rendered_covers(rendered):
+    """CLI ke banaye covers (id, filename, purana version, naya version) ek sath save karen"""
+    existing_ids = {row.id for row in db.session.query(Pdf.id).filter(Pdf.id.in_([item[0] for item in rendered]))}
+    if existing_ids:
+        db.session.execute(db.update(Pdf), [{'id': pdf_id, 'cover_version': version, 'has_cover': True}
+                                            for pdf_id, _, _, version in rendered if pdf_id in existing_ids])
+    db.session.commit()
+    for pdf_id, filename, old_version, version in rendered:
+        if pdf_id in existing_ids:
+            delete_old_covers(filename, old_version, version)
+        else:
+            storage.delete_many(cover_keys(filename, version))
+
+# ===================== OFFLINE BUNDLES =====================
+
+# kind -> (parent model, child model, child ka foreign key)
+BUNDLE_SOURCES = {
+    'topic': (ReferenceTopic, Reference, Reference.topic_id),
+    'category': (PdfCategory, Pdf, Pdf.category_id),
+}
+BUNDLE_FORMAT = 1
+
+@db.event.listens_for(db.session, 'before_flush')
+def track_bundle_changes(session, flush_context, instances):
+    """Bundle wale fields badlen to updated_at tazah karen - view_count waghera se bundle purana nahi hota"""
+    for obj in list(session.new) + list(session.deleted):
+        if hasattr(obj, 'bundle_fields'):
+            session.info['bundles_stale'] = True
+    for obj in session.dirty:
+        fields = getattr(obj, 'bundle_fields', None)
+        if fields and obj not in session.deleted:
+            state = db.inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in fields):
+                obj.updated_at = datetime.utcnow()
+                session.info['bundles_stale'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def schedule_bundle_rebuild(session):
+    if session.info.pop('bundles_stale', False):
+        enqueue_unique_job('rebuild_stale_bundles', rebuild_stale_bundles, queue_name='bundles')
+
+def mark_bundles_stale():
+    """Bulk UPDATE/DELETE ORM events se nahi guzarte - commit se pehle khud batayen"""
+    db.session.info['bundles_stale'] = True
+
+def bundle_etags(kind, parent_id=None):
+    """Har topic/category ke content ka fingerprint - ek hi grouped query se"""
+    parent_model, child_model, parent_column = BUNDLE_SOURCES[kind]
+    stats = db.session.query(parent_column, func.count(child_model.id), func.sum(child_model.id),
+                             func.max(child_model.updated_at)).group_by(parent_column)
+    parents = db.session.query(parent_model.id, parent_model.updated_at)
+    if parent_id is not None:
+        stats = stats.filter(parent_column == parent_id)
+        parents = parents.filter(parent_model.id == parent_id)
+    stats = {row[0]: tuple(row[1:]) for row in stats}
+
+    etags = {}
+    for row in parents:
+        raw = f"{BUNDLE_FORMAT}:{kind}:{row.id}:{row.updated_at}:{stats.get(row.id)}"
+        etags[row.id] = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+    return etags
+
+def bundle_key(kind, parent_id, etag, include_pdfs=False):
+    return f"bundles/{kind}-{parent_id}-{etag}{'-pdfs' if include_pdfs else ''}.zip"
+
+def _write_bundle_database(db_path, kind, parent, etag):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ('format', str(BUNDLE_FORMAT)), ('kind', kind), ('id', str(parent.id)), ('name', parent.name),
+        ('description', parent.description or ''), ('etag', etag), ('built_at', datetime.utcnow().isoformat()),
+    ])
+    if kind == 'topic':
+        conn.execute("CREATE TABLE reference (id INTEGER PRIMARY KEY, title TEXT, content TEXT, created_at TEXT)")
+        references = Reference.query.options(db.undefer(Reference.content)).filter_by(
+            topic_id=parent.id).order_by(Reference.id).yield_per(200)
+        conn.executemany("INSERT INTO reference VALUES (?, ?, ?, ?)", (
+            (ref.id, ref.title, ref.content, ref.created_at.isoformat() if ref.created_at else None)
+            for ref in references))
+    else:
+        conn.execute("CREATE TABLE pdf (id INTEGER PRIMARY KEY, title TEXT, filename TEXT, size INTEGER, uploaded_at TEXT)")
+        pdfs = Pdf.query.filter_by(category_id=parent.id).order_by(Pdf.id).yield_per(200)
+        conn.executemany("INSERT INTO pdf VALUES (?, ?, ?, ?, ?)", (
+            (pdf.id, pdf.title, pdf.filename, pdf.optimized_size or pdf.original_size,
+             pdf.uploaded_at.isoformat() if pdf.uploaded_at else None)
+            for pdf in pdfs))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+def build_bundle(kind, parent_id, include_pdfs=False):
+    """Topic/category ka offline bundle (SQLite + optional PDFs, zip me) banayen - tazah ho to kuch nahi"""
+    parent_model = BUNDLE_SOURCES[kind][0]
+    parent = db.session.get(parent_model, parent_id)
+    if parent is None:
+        return
+
+    etag = bundle_etags(kind, parent_id)[parent_id]
+    key = bundle_key(kind, parent_id, etag, include_pdfs)
+    if not storage.exists(key):
+        with tempfile.TemporaryDirectory(prefix='dalildocs-bundle-') as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'bundle.sqlite')
+            _write_bundle_database(db_path, kind, parent, etag)
+            zip_path = os.path.join(tmp_dir, 'bundle.zip')
+            with zipfile.ZipFile(zip_path, 'w') as bundle:
+                bundle.write(db_path, 'bundle.sqlite', compress_type=zipfile.ZIP_DEFLATED)
+                if include_pdfs:
+                    # PDFs pehle se compressed hain - dobara compress karna waqt ka ziya
+                    for pdf in parent.pdfs:
+                        if storage.exists(f'pdfs/{pdf.filename}'):
+                            with storage.local_copy(f'pdfs/{pdf.filename}') as pdf_path:
+                                bundle.write(pdf_path, f'pdfs/{pdf.filename}', compress_type=zipfile.ZIP_STORED)
+            storage.put_file(zip_path, key)
+
+    if parent.bundle_etag != etag:
+        if parent.bundle_etag:
+            storage.delete_many([bundle_key(kind, parent_id, parent.bundle_etag, variant) for variant in (False, True)])
+        parent.bundle_etag = etag
+        db.session.commit()
+
+def rebuild_stale_bundles():
+    """Sirf un bundles ko dobara banayen jo pehle ban chuke hain aur jin ka content badal gaya"""
+    for kind, (parent_model, _, _) in BUNDLE_SOURCES.items():
+        etags = bundle_etags(kind)
+        stale = parent_model.query.filter(parent_model.bundle_etag.isnot(None)).with_entities(
+            parent_model.id, parent_model.bundle_etag).all()
+        for parent_id, built_etag in stale:
+            if etags.get(parent_id) == built_etag:
+                continue
+            with_pdfs = kind == 'category' and storage.exists(bundle_key(kind, parent_id, built_etag, True))
+            build_bundle(kind, parent_id)
+            if with_pdfs:
+                build_bundle(kind, parent_id, include_pdfs=True)
+
+def delete_bundles(kind, parent):
+    if parent.bundle_etag:
+        storage.delete_many([bundle_key(kind, parent.id, parent.bundle_etag, variant) for variant in (False, True)])
+
+def send_bundle(kind, parent, include_pdfs=False):
+    """Bundle ETag ke sath bhejen - client ke paas tazah ho to 304, abhi bana nahi to 202"""
+    etag = bundle_etags(kind, parent.id)[parent.id]
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    key = bundle_key(kind, parent.id, etag, include_pdfs)
+    if not storage.exists(key):
+        # Polling se har dafa naya build na lage - aur PDFs wale bundles upload queue ko na rokain
+        enqueue_unique_job(key, build_bundle, kind, parent.id, include_pdfs, queue_name='bundles')
+        response = jsonify({'status': 'building', 'etag': etag})
+        response.status_code = 202
+        response.headers['Retry-After'] = '10'
+        return response
+
+    response = storage.send(key, as_attachment=True, download_name=f'{kind}-{parent.id}.zip')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
 # ===================== PUBLIC ROUTES =====================
 
 @app.route('/uploads/<folder>/<filename>')
@@ -110,17 +947,24 @@ def serve_upload(folder, filename):
     allowed_folders = ['pdf_topics', 'ref_topics', 'pdfs']
     if folder not in allowed_folders:
         abort(404)
-    from werkzeug.utils import safe_join
-    upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], folder)
-    return send_from_directory(upload_dir, filename)
+    if filename != secure_filename(filename):
+        abort(404)
+    if folder == 'pdfs' and VERSIONED_COVER_RE.search(filename):
+        # Naam me chaudai aur content hash hai - naya cover hamesha naye URL par aata hai
+        return storage.send(f'{folder}/{filename}', max_age=365 * 24 * 3600, immutable=True)
+    return storage.send(f'{folder}/{filename}')
 
 @app.route('/sw.js')
 def service_worker():
-    return send_from_directory('static', 'service-worker.js', mimetype='application/javascript')
+    # Browser har dafa revalidate kare (ETag se sasta) taake naya deploy foran mil jaye
+    if os.path.exists(os.path.join(app.static_folder, ASSET_BUILD_DIR, 'service-worker.js')):
+        return send_static_asset(f'{ASSET_BUILD_DIR}/service-worker.js', max_age=0)
+    return send_static_asset('service-worker.js', max_age=0)
 
 @app.route('/manifest.json')
 def manifest():
-    return send_from_directory('static', 'manifest.json', mimetype='application/json')
+    hashed_name = get_asset_manifest()['assets'].get('manifest.json')
+    return send_static_asset(hashed_name or 'manifest.json', max_age=24 * 3600)
 
 @app.route('/')
 def home():
@@ -176,12 +1020,13 @@ def ask_us():
     if request.method == 'POST':
         name = request.form.get('name')
         question_text = request.form.get('question')
-        new_question = Question(user_name=name, question=question_text)
+        new_question = Question(user_name=name, question=question_text, asker_token=get_or_create_asker_token())
         db.session.add(new_question)
         db.session.commit()
         flash('✅ Aap ka sawal bhej diya gaya hai', 'success')
         return redirect(url_for('ask_us'))
-    return render_template('ask_us.html')
+    # Template token ko localStorage me rakhta hai taake session khatam hone par bhi sawal milen
+    return render_template('ask_us.html', asker_token=session.get('asker_token'))
 
 @app.route('/search')
 def search():
@@ -202,9 +1047,25 @@ def search():
             categories = PdfCategory.query.filter(PdfCategory.name.ilike(search_pattern)).all()
         
         if search_type in ['all', 'references']:
-            references = Reference.query.filter(
+            # Poora content load karne ke bajaye sirf match ke ird gird ka hissa database se
+            match_pos = text_position(Reference.content, query)
+            snippet_start = db.case((match_pos > SNIPPET_RADIUS, match_pos - SNIPPET_RADIUS), else_=1)
+            rows = db.session.query(
+                Reference, match_pos, snippet_start, func.substr(Reference.content, snippet_start, SNIPPET_LENGTH)
+            ).filter(
                 db.or_(Reference.title.ilike(search_pattern), Reference.content.ilike(search_pattern))
             ).all()
+
+            for reference, position, start, snippet in rows:
+                if position:
+                    if start > 1:
+                        snippet = '…' + snippet
+                    if start + SNIPPET_LENGTH <= (reference.content_length or 0):
+                        snippet = snippet + '…'
+                else:
+                    snippet = reference.excerpt
+                reference.snippet = highlight_snippet(snippet, query)
+                references.append(reference)
             topics = ReferenceTopic.query.filter(ReferenceTopic.name.ilike(search_pattern)).all()
     
     return render_template('search.html', 
@@ -228,8 +1089,7 @@ def download_pdf(pdf_id):
     pdf = Pdf.query.get_or_404(pdf_id)
     pdf.download_count = (pdf.download_count or 0) + 1
     db.session.commit()
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdfs', pdf.filename)
-    return send_file(file_path, as_attachment=True, download_name=pdf.title + '.pdf')
+    return storage.send(f'pdfs/{pdf.filename}', as_attachment=True, download_name=pdf.title + '.pdf')
 
 @app.route('/pdf/category/<int:category_id>')
 def pdf_category(category_id):
@@ -251,7 +1111,7 @@ def pdf_category(category_id):
 
 @app.route('/reference/<int:ref_id>')
 def view_reference(ref_id):
-    reference = Reference.query.get_or_404(ref_id)
+    reference = Reference.query.options(db.undefer(Reference.content)).get_or_404(ref_id)
     reference.view_count = (reference.view_count or 0) + 1
     db.session.commit()
     
@@ -275,10 +1135,36 @@ def topic_references(topic_id):
     
     return render_template('topic_references.html', topic=topic, references=references, sort=sort)
 
+@app.route('/topic/<int:topic_id>/bundle')
+def topic_bundle(topic_id):
+    topic = ReferenceTopic.query.get_or_404(topic_id)
+    return send_bundle('topic', topic)
+
+@app.route('/pdf/category/<int:category_id>/bundle')
+def pdf_category_bundle(category_id):
+    category = PdfCategory.query.get_or_404(category_id)
+    return send_bundle('category', category, include_pdfs=request.args.get('pdfs') == '1')
+
+@app.route('/bundles')
+def bundles_index():
+    """Tamam bundles ke ETags - client sirf purane bundles dobara download kare"""
+    topics = ReferenceTopic.query.with_entities(ReferenceTopic.id, ReferenceTopic.name).all()
+    categories = PdfCategory.query.with_entities(PdfCategory.id, PdfCategory.name).all()
+    topic_etags = bundle_etags('topic')
+    category_etags = bundle_etags('category')
+    return jsonify({
+        'topics': [{'id': t.id, 'name': t.name, 'etag': topic_etags[t.id],
+                    'url': url_for('topic_bundle', topic_id=t.id)} for t in topics],
+        'categories': [{'id': c.id, 'name': c.name, 'etag': category_etags[c.id],
+                        'url': url_for('pdf_category_bundle', category_id=c.id)} for c in categories],
+    })
+
 @app.route('/bookmarks')
 def bookmarks():
     user_id = get_or_create_user_id()
-    bookmarks = Bookmark.query.filter_by(user_id=user_id).order_by(Bookmark.created_at.desc()).all()
+    bookmarks = Bookmark.query.filter_by(user_id=user_id).options(
+        db.joinedload(Bookmark.reference)
+    ).order_by(Bookmark.created_at.desc()).all()
     return render_template('bookmarks.html', bookmarks=bookmarks)
 
 @app.route('/bookmark/<int:ref_id>', methods=['POST'])
@@ -297,10 +1183,68 @@ def toggle_bookmark(ref_id):
     db.session.commit()
     return redirect(request.referrer or url_for('references'))
 
+@app.route('/my_questions', methods=['GET', 'POST'])
+def my_questions():
+    token = get_asker_token()
+    questions = []
+    next_cursor = None
+
+    if token:
+        query = Question.query.filter_by(asker_token=token)
+        # Keyset pagination: before=<created_at>_<id> - offset ke baghair, index se seedha
+        before = request.values.get('before')
+        if before:
+            try:
+                created_at, question_id = before.rsplit('_', 1)
+                created_at, question_id = datetime.fromisoformat(created_at), int(question_id)
+            except ValueError:
+                abort(400)
+            query = query.filter(db.or_(
+                Question.created_at < created_at,
+                db.and_(Question.created_at == created_at, Question.id < question_id),
+            ))
+        questions = query.order_by(Question.created_at.desc(), Question.id.desc()).limit(MY_QUESTIONS_PAGE_SIZE + 1).all()
+        if len(questions) > MY_QUESTIONS_PAGE_SIZE:
+            questions = questions[:MY_QUESTIONS_PAGE_SIZE]
+            next_cursor = f"{questions[-1].created_at.isoformat()}_{questions[-1].id}"
+
+    user_name = questions[0].user_name if questions else None
+    return render_template('my_questions.html', questions=questions, user_name=user_name, next_cursor=next_cursor)
+
 @app.route('/my_questions/<user_name>')
-def my_questions(user_name):
-    questions = Question.query.filter_by(user_name=user_name).order_by(Question.created_at.desc()).all()
-    return render_template('my_questions.html', questions=questions, user_name=user_name)
+def my_questions_by_name(user_name):
+    # Purane links - naam se sawal ab nahi dikhaye jate
+    return redirect(url_for('my_questions'))
+
+@app.route('/my_questions/status')
+def my_questions_status():
+    """Jawab ke liye polling - sirf chhote columns, aur kuch na badla ho to 304"""
+    token = get_asker_token()
+    if not token:
+        return jsonify({'pending': 0, 'answered': []})
+
+    pending = Question.query.filter_by(asker_token=token, status='pending').count()
+    answered = db.session.query(Question.id, Question.replied_at).filter(
+        Question.asker_token == token, Question.status == 'answered'
+    )
+    since = request.args.get('since')
+    if since:
+        try:
+            answered = answered.filter(Question.replied_at > datetime.fromisoformat(since))
+        except ValueError:
+            abort(400)
+    answered = answered.order_by(Question.replied_at.desc()).limit(MY_QUESTIONS_PAGE_SIZE).all()
+
+    response = jsonify({
+        'pending': pending,
+        'answered': [{'id': q.id, 'replied_at': q.replied_at.isoformat() if q.replied_at else None}
+                     for q in answered],
+    })
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.update(['Cookie', 'X-Asker-Token'])
+    response.add_etag()
+    return response.make_conditional(request)
 
 # ===================== ADMIN ROUTES =====================
 
@@ -382,11 +1326,7 @@ def admin_pdfs():
                 if file and file.filename:
                     ext = file.filename.rsplit('.', 1)[-1].lower()
                     if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                        filename = secure_filename(file.filename)
-                        unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdf_topics', unique_filename)
-                        file.save(file_path)
-                        image_filename = unique_filename
+                        image_filename = save_upload(file, 'pdf_topics')
             
             new_category = PdfCategory(name=name, description=description, image=image_filename)
             db.session.add(new_category)
@@ -406,18 +1346,17 @@ def admin_pdfs():
             if 'pdf_file' in request.files:
                 file = request.files['pdf_file']
                 if file and file.filename and file.filename.endswith('.pdf'):
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdfs', unique_filename)
-                    file.save(file_path)
+                    unique_filename = save_upload(file, 'pdfs')
                     
                     # Use filename as title if title is not provided
                     if not title:
-                        title = filename.rsplit('.', 1)[0]
+                        title = secure_filename(file.filename).rsplit('.', 1)[0]
                     
                     new_pdf = Pdf(title=title, filename=unique_filename, category_id=category_id)
                     db.session.add(new_pdf)
                     db.session.commit()
+                    enqueue_job(optimize_pdf, new_pdf.id)
+                    enqueue_job(render_cover, new_pdf.id)
                     flash('✅ PDF shamil ho gayi', 'success')
 
         elif action == 'bulk_upload':
@@ -432,23 +1371,25 @@ def admin_pdfs():
             if 'bulk_pdfs' in request.files:
                 files = request.files.getlist('bulk_pdfs')
                 uploaded_count = 0
+                new_pdfs = []
                 
                 for file in files:
                     if file and file.filename and file.filename.endswith('.pdf'):
-                        filename = secure_filename(file.filename)
-                        unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdfs', unique_filename)
-                        file.save(file_path)
+                        unique_filename = save_upload(file, 'pdfs')
                         
                         # Use filename as title
-                        title = filename.rsplit('.', 1)[0]
+                        title = secure_filename(file.filename).rsplit('.', 1)[0]
                         
                         new_pdf = Pdf(title=title, filename=unique_filename, category_id=category_id)
                         db.session.add(new_pdf)
+                        new_pdfs.append(new_pdf)
                         uploaded_count += 1
                 
                 if uploaded_count > 0:
                     db.session.commit()
+                    for new_pdf in new_pdfs:
+                        enqueue_job(optimize_pdf, new_pdf.id)
+                        enqueue_job(render_cover, new_pdf.id)
                     flash(f'✅ {uploaded_count} PDFs shamil ho gayin', 'success')
                 else:
                     flash('❌ Koi PDF select nahi ki gayi', 'danger')
@@ -474,15 +1415,9 @@ def edit_pdf_category(cat_id):
                 ext = file.filename.rsplit('.', 1)[-1].lower()
                 if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
                     if category.image:
-                        old_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdf_topics', category.image)
-                        if os.path.exists(old_path):
-                            os.remove(old_path)
+                        storage.delete(f'pdf_topics/{category.image}')
                     
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdf_topics', unique_filename)
-                    file.save(file_path)
-                    category.image = unique_filename
+                    category.image = save_upload(file, 'pdf_topics')
         
         db.session.commit()
         flash('✅ Category update ho gayi', 'success')
@@ -513,9 +1448,7 @@ def delete_pdf(pdf_id):
         return redirect(url_for('admin_login'))
     
     pdf = Pdf.query.get_or_404(pdf_id)
-    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdfs', pdf.filename)
-    if os.path.exists(pdf_path):
-        os.remove(pdf_path)
+    delete_pdf_files((pdf.filename, pdf.cover_version))
     
     db.session.delete(pdf)
     db.session.commit()
@@ -530,20 +1463,79 @@ def delete_pdf_category(cat_id):
     category = PdfCategory.query.get_or_404(cat_id)
     
     if category.image:
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdf_topics', category.image)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        storage.delete(f'pdf_topics/{category.image}')
     
-    for pdf in category.pdfs:
-        pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], 'pdfs', pdf.filename)
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
+    delete_pdf_files(*[(pdf.filename, pdf.cover_version) for pdf in category.pdfs])
+    delete_bundles('category', category)
 
     db.session.delete(category)
     db.session.commit()
     flash('✅ Category aur sab PDFs hazf ho gayin', 'success')
     return redirect(url_for('admin_pdfs'))
 
+@app.route('/admin/pdfs/bulk', methods=['POST'])
+def bulk_pdfs():
+    """Chuni hui PDFs par ek hi transaction me kaam - preview=1 par sirf tadad (JSON)"""
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+
+    action = request.form.get('action')
+    preview = request.form.get('preview') == '1'
+    titles = {}
+    too_long = []
+    if action == 'retitle':
+        if request.files.get('titles_csv'):
+            try:
+                titles, too_long = read_titles_csv(request.files['titles_csv'], Pdf.title.type.length)
+            except UnicodeDecodeError:
+                if preview:
+                    return jsonify({'action': action, 'error': 'CSV file UTF-8 me honi chahiye'}), 400
+                flash('❌ CSV file UTF-8 me save karen', 'danger')
+                return redirect(url_for('admin_pdfs'))
+        ids = list(titles)
+    else:
+        ids = get_selected_ids()
+
+    selected = Pdf.query.filter(Pdf.id.in_(ids))
+    affected = selected.count()
+    if preview:
+        return jsonify({'action': action, 'affected': affected, 'skipped': len(ids) - affected,
+                        'too_long': len(too_long)})
+
+    if action == 'move':
+        category_id = request.form.get('category_id', type=int)
+        if category_id is None or db.session.get(PdfCategory, category_id) is None:
+            flash('❌ Category muntakhib karen', 'danger')
+            return redirect(url_for('admin_pdfs'))
+        selected.update({Pdf.category_id: category_id, Pdf.updated_at: datetime.utcnow()},
+                        synchronize_session=False)
+        mark_bundles_stale()
+        db.session.commit()
+        flash(f'✅ {affected} PDFs muntaqil ho gayin', 'success')
+
+    elif action == 'delete':
+        files = [tuple(row) for row in selected.with_entities(Pdf.filename, Pdf.cover_version)]
+        selected.delete(synchronize_session=False)
+        mark_bundles_stale()
+        db.session.commit()
+        # Files transaction ke baad background me hazf hoti hain
+        enqueue_job(delete_pdf_files, *files)
+        flash(f'✅ {affected} PDFs hazf ho gayin', 'success')
+
+    elif action == 'retitle':
+        existing_ids = {row.id for row in selected.with_entities(Pdf.id)}
+        if existing_ids:
+            updated_at = datetime.utcnow()
+            db.session.execute(db.update(Pdf), [{'id': pdf_id, 'title': title, 'updated_at': updated_at}
+                                                for pdf_id, title in titles.items() if pdf_id in existing_ids])
+            mark_bundles_stale()
+            db.session.commit()
+        flash(f'✅ {affected} PDFs ke unwan tabdeel ho gaye', 'success')
+        if too_long:
+            flash(f'❌ {len(too_long)} unwan {Pdf.title.type.length} huroof se lambe the - chhor diye gaye', 'danger')
+
+    return redirect(url_for('admin_pdfs'))
+
 # ===================== ADMIN REFERENCE MANAGEMENT =====================
 
 @app.route('/admin/references', methods=['GET', 'POST'])
@@ -564,11 +1556,7 @@ def admin_references():
                 if file and file.filename:
                     ext = file.filename.rsplit('.', 1)[-1].lower()
                     if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                        filename = secure_filename(file.filename)
-                        unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'ref_topics', unique_filename)
-                        file.save(file_path)
-                        image_filename = unique_filename
+                        image_filename = save_upload(file, 'ref_topics')
             
             new_topic = ReferenceTopic(name=name, description=description, image=image_filename)
             db.session.add(new_topic)
@@ -606,15 +1594,9 @@ def edit_ref_topic(topic_id):
                 ext = file.filename.rsplit('.', 1)[-1].lower()
                 if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
                     if topic.image:
-                        old_path = os.path.join(app.config['UPLOAD_FOLDER'], 'ref_topics', topic.image)
-                        if os.path.exists(old_path):
-                            os.remove(old_path)
+                        storage.delete(f'ref_topics/{topic.image}')
                     
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'ref_topics', unique_filename)
-                    file.save(file_path)
-                    topic.image = unique_filename
+                    topic.image = save_upload(file, 'ref_topics')
         
         db.session.commit()
         flash('✅ Topic update ho gaya', 'success')
@@ -627,7 +1609,7 @@ def edit_reference(ref_id):
     if not is_admin_logged_in():
         return redirect(url_for('admin_login'))
     
-    reference = Reference.query.get_or_404(ref_id)
+    reference = Reference.query.options(db.undefer(Reference.content)).get_or_404(ref_id)
     topics = ReferenceTopic.query.all()
     
     if request.method == 'POST':
@@ -661,18 +1643,78 @@ def delete_ref_topic(topic_id):
     topic = ReferenceTopic.query.get_or_404(topic_id)
     
     if topic.image:
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'ref_topics', topic.image)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+        storage.delete(f'ref_topics/{topic.image}')
     
     for ref in topic.references:
         Bookmark.query.filter_by(reference_id=ref.id).delete()
+    delete_bundles('topic', topic)
 
     db.session.delete(topic)
     db.session.commit()
     flash('✅ Topic aur sab hawale hazf ho gaye', 'success')
     return redirect(url_for('admin_references'))
 
+@app.route('/admin/references/bulk', methods=['POST'])
+def bulk_references():
+    """Chune hue hawalon par ek hi transaction me kaam - preview=1 par sirf tadad (JSON)"""
+    if not is_admin_logged_in():
+        return redirect(url_for('admin_login'))
+
+    action = request.form.get('action')
+    preview = request.form.get('preview') == '1'
+    titles = {}
+    too_long = []
+    if action == 'retitle':
+        if request.files.get('titles_csv'):
+            try:
+                titles, too_long = read_titles_csv(request.files['titles_csv'], Reference.title.type.length)
+            except UnicodeDecodeError:
+                if preview:
+                    return jsonify({'action': action, 'error': 'CSV file UTF-8 me honi chahiye'}), 400
+                flash('❌ CSV file UTF-8 me save karen', 'danger')
+                return redirect(url_for('admin_references'))
+        ids = list(titles)
+    else:
+        ids = get_selected_ids()
+
+    selected = Reference.query.filter(Reference.id.in_(ids))
+    affected = selected.count()
+    if preview:
+        return jsonify({'action': action, 'affected': affected, 'skipped': len(ids) - affected,
+                        'too_long': len(too_long)})
+
+    if action == 'move':
+        topic_id = request.form.get('topic_id', type=int)
+        if topic_id is None or db.session.get(ReferenceTopic, topic_id) is None:
+            flash('❌ Topic muntakhib karen', 'danger')
+            return redirect(url_for('admin_references'))
+        selected.update({Reference.topic_id: topic_id, Reference.updated_at: datetime.utcnow()},
+                        synchronize_session=False)
+        mark_bundles_stale()
+        db.session.commit()
+        flash(f'✅ {affected} hawale muntaqil ho gaye', 'success')
+
+    elif action == 'delete':
+        Bookmark.query.filter(Bookmark.reference_id.in_(ids)).delete(synchronize_session=False)
+        selected.delete(synchronize_session=False)
+        mark_bundles_stale()
+        db.session.commit()
+        flash(f'✅ {affected} hawale hazf ho gaye', 'success')
+
+    elif action == 'retitle':
+        existing_ids = {row.id for row in selected.with_entities(Reference.id)}
+        if existing_ids:
+            updated_at = datetime.utcnow()
+            db.session.execute(db.update(Reference), [{'id': ref_id, 'title': title, 'updated_at': updated_at}
+                                                      for ref_id, title in titles.items() if ref_id in existing_ids])
+            mark_bundles_stale()
+            db.session.commit()
+        flash(f'✅ {affected} hawalon ke unwan tabdeel ho gaye', 'success')
+        if too_long:
+            flash(f'❌ {len(too_long)} unwan {Reference.title.type.length} huroof se lambe the - chhor diye gaye', 'danger')
+
+    return redirect(url_for('admin_references'))
+
 # ===================== ADMIN QUESTIONS =====================
 
 @app.route('/admin/questions')
@@ -802,14 +1844,169 @@ def change_password():
     
     return render_template('change_password.html', admin=admin)
 
+# ===================== CLI COMMANDS =====================
+
+@app.cli.command('optimize-pdfs')
+@click.option('--all', 'process_all', is_flag=True, help='Pehle se optimized PDFs bhi dobara process karen')
+def optimize_pdfs_command(process_all):
+    """Mojooda library ki PDFs optimize karen (backfill)"""
+    pdf_ids = db.session.query(Pdf.id)
+    if not process_all:
+        pdf_ids = pdf_ids.filter(db.or_(Pdf.optimize_status.is_(None),
+                                        Pdf.optimize_status.in_(['pending', 'failed'])))
+    pdf_ids = [row.id for row in pdf_ids.order_by(Pdf.id).all()]
+
+    saved = 0
+    for index, pdf_id in enumerate(pdf_ids, start=1):
+        optimize_pdf(pdf_id)
+        pdf = db.session.get(Pdf, pdf_id)
+        if pdf.original_size and pdf.optimized_size:
+            saved += pdf.original_size - pdf.optimized_size
+        print(f"[{index}/{len(pdf_ids)}] {pdf.filename}: {pdf.optimize_status}")
+        db.session.expunge_all()
+
+    print(f"✅ {len(pdf_ids)} PDFs process ho gayin, {saved / (1024 * 1024):.1f} MB bachat")
+
+@app.cli.command('render-covers')
+@click.option('--all', 'process_all', is_flag=True, help='Mojooda covers bhi dobara banayen')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, help='Parallel processes ki tadad')
+def render_covers_command(process_all, workers):
+    """Library ki tamam PDFs ke covers sab cores par parallel banayen"""
+    pdfs = db.session.query(Pdf.id, Pdf.filename, Pdf.cover_version)
+    if not process_all:
+        pdfs = pdfs.filter(db.or_(Pdf.has_cover.is_(None), Pdf.has_cover.is_(False)))
+    pdfs = pdfs.order_by(Pdf.id).all()
+
+    width = app.config['COVER_WIDTH']
+    pending = iter(pdfs)
+    in_flight = {}
+    rendered = []
+    failed = 0
+
+    # Ek waqt me sirf workers * 2 kaam queue me - memory mehdood rehti hai
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=50) as executor:
+        while True:
+            while len(in_flight) < workers * 2:
+                row = next(pending, None)
+                if row is None:
+                    break
+                future = executor.submit(render_stored_cover, row.filename, width)
+                in_flight[future] = row
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                row = in_flight.pop(future)
+                try:
+                    version = future.result()
+                except Exception as e:
+                    print(f"❌ {row.filename}: {e}")
+                    version = None
+                if version:
+                    rendered.append((row.id, row.filename, row.cover_version, version))
+                else:
+                    failed += 1
+
+            if len(rendered) >= 100:
+                save_rendered_covers(rendered)
+                rendered = []
+
+    if rendered:
+        save_rendered_covers(rendered)
+
+    print(f"✅ {len(pdfs) - failed} covers ban gaye, {failed} nakam")
+
+@app.cli.command('build-bundles')
+@click.option('--pdfs', 'include_pdfs', is_flag=True, help='Category bundles me PDFs bhi shamil karen')
+def build_bundles_command(include_pdfs):
+    """Tamam topics aur categories ke offline bundles banayen - tazah bundles chhor diye jate hain"""
+    for topic_id, in ReferenceTopic.query.with_entities(ReferenceTopic.id).all():
+        build_bundle('topic', topic_id)
+    for category_id, in PdfCategory.query.with_entities(PdfCategory.id).all():
+        build_bundle('category', category_id, include_pdfs=include_pdfs)
+    print("✅ Offline bundles tayyar hain")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Static assets ko fingerprint aur precompress karen (deploy se pehle)"""
+    manifest = build_static_assets()
+    print(f"✅ {len(manifest['assets'])} static files build ho gayin (version {manifest['version']})")
+
 # ===================== DATABASE INITIALIZATION =====================
 
+def sync_schema():
+    """create_all sirf nayi tables banata hai - purani tables me nayi columns aur indexes shamil karen.
+
+    Har gunicorn worker startup par chalata hai - agar doosre worker ne pehle hi column/index bana
+    diya ho to us ki ghalti nazar andaz hoti hai.
+    """
+    inspector = db.inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(db.text(
+                            f"ALTER TABLE {preparer.quote(table.name)} "
+                            f"ADD COLUMN {preparer.quote(column.name)} {column_type}"))
+                    print(f"✅ Column {table.name}.{column.name} shamil ho gayi")
+                except Exception:
+                    fresh_columns = {c['name'] for c in db.inspect(db.engine).get_columns(table.name)}
+                    if column.name not in fresh_columns:
+                        raise
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                try:
+                    with db.engine.begin() as conn:
+                        index.create(conn)
+                    print(f"✅ Index {index.name} ban gaya")
+                except Exception:
+                    fresh_indexes = {i['name'] for i in db.inspect(db.engine).get_indexes(table.name)}
+                    if index.name not in fresh_indexes:
+                        raise
+
+def backfill_reference_excerpts(batch_size=500):
+    """Purane hawalon ke liye excerpt aur content_length bharen"""
+    total = 0
+    while True:
+        batch = Reference.query.options(db.undefer(Reference.content)).filter(
+            Reference.excerpt.is_(None)
+        ).limit(batch_size).all()
+        if not batch:
+            break
+        for reference in batch:
+            reference.excerpt = make_excerpt(reference.content)
+            reference.content_length = len(reference.content or '')
+        db.session.commit()
+        total += len(batch)
+    if total:
+        print(f"✅ {total} hawalon ke excerpts ban gaye")
+
+def prepare_database():
+    """Tables, nayi columns aur excerpts - dobara chalana mehfooz hai"""
+    db.create_all()
+    sync_schema()
+    backfill_reference_excerpts()
+
+@app.cli.command('sync-db')
+def sync_db_command():
+    """Server start hone se pehle schema aur excerpts up to date karen (gunicorn se pehle chalta hai)"""
+    prepare_database()
+    print("✅ Database schema up to date hai")
+
 def init_database():
     """Database initialization - ek baar me saari setup"""
     with app.app_context():
         try:
             # Pehle check karen ke tables hain ya nahi
-            db.create_all()
+            prepare_database()
             print("✅ Database tables create ho gaye!")
             
             # Main admin check karen